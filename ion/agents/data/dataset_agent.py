@@ -21,7 +21,9 @@ interrupt/resume state:
 __author__ = 'Christopher Mueller, Jonathan Newbrough, Bill French'
 
 
-import os, sys, gevent, json, math, time, copy
+import os, sys, errno, gevent, json, time, copy
+
+from gevent.event import Event
 
 from ooi.logging import log
 from ooi.poller import DirectoryPoller
@@ -47,8 +49,21 @@ from coverage_model import ParameterDictionary
 
 # TODO: make unique for multiple processes on same VM
 EGG_CACHE_DIR='/tmp/eggs%d' % os.getpid()
+
+# Ensure the egg cache directory exists. ooi.reflections will fail
+# somewhat silently when this directory doesn't exists.
+try:
+    os.makedirs(EGG_CACHE_DIR)
+except OSError as e:
+    if e.errno != errno.EEXIST:
+        log.error('could not create egg cache directory %s', EGG_CACHE_DIR, exc_info=True)
+
 EGG_CACHE=EggCache(EGG_CACHE_DIR)
+# driver classes already loaded through EGG_CACHE, keyed by
+# (class name, module name, egg name, egg repo)
+_DRIVER_CLASSES = {}
 DSA_STATE_KEY = 'dsa_state'
+_REQUIRED_DRIVER_CONFIG_KEYS = frozenset(['startup_config', 'dvr_mod', 'dvr_cls'])
 
 class DataSetAgentCapability(BaseEnum):
     INITIALIZE = ResourceAgentEvent.INITIALIZE
@@ -61,6 +76,66 @@ class DataSetAgentCapability(BaseEnum):
     RESUME = ResourceAgentEvent.RESUME
     GO_COMMAND = ResourceAgentEvent.GO_COMMAND
 
+    @classmethod
+    def has(cls, item):
+        """
+        Same as BaseEnum.has, but uses the value set computed at import.
+        """
+        return item in _CAPABILITY_VALUES
+
+# BaseEnum.has rebuilds the value list on every call, so compute it once.
+# Kept at module level since BaseEnum.list would report a class attribute
+# as one of the enum values.
+_CAPABILITY_VALUES = frozenset(DataSetAgentCapability.list())
+
+# FSM events used to restore the agent to a persisted state.  Each step is
+# (event, event args, state to confirm afterwards or None).
+_RESTORE_COMMAND_STEPS = (
+    (ResourceAgentEvent.INITIALIZE, (), None),
+    (ResourceAgentEvent.GO_ACTIVE, (), ResourceAgentState.IDLE),
+    (ResourceAgentEvent.RUN, (), ResourceAgentState.COMMAND),
+)
+
+_RESTORE_SCRIPTS = {
+    # If inactive, initialize and confirm.
+    ResourceAgentState.INACTIVE: (
+        (ResourceAgentEvent.INITIALIZE, (), ResourceAgentState.INACTIVE),
+    ),
+    # If idle, initialize, activate and confirm.
+    ResourceAgentState.IDLE: (
+        (ResourceAgentEvent.INITIALIZE, (), None),
+        (ResourceAgentEvent.GO_ACTIVE, (), ResourceAgentState.IDLE),
+    ),
+    # If streaming, initialize, activate and confirm.
+    # Driver discover should put us in streaming mode.
+    ResourceAgentState.STREAMING: (
+        (ResourceAgentEvent.INITIALIZE, (), None),
+        (ResourceAgentEvent.GO_ACTIVE, (), None),
+        (ResourceAgentEvent.RUN, (), None),
+        (ResourceAgentEvent.EXECUTE_RESOURCE, (DriverEvent.START_AUTOSAMPLE,), ResourceAgentState.STREAMING),
+    ),
+    # If command, initialize, activate, confirm idle, run and confirm command.
+    ResourceAgentState.COMMAND: _RESTORE_COMMAND_STEPS,
+    # If paused, initialize, activate, confirm idle,
+    # run, confirm command, pause and confirm stopped.
+    ResourceAgentState.STOPPED: _RESTORE_COMMAND_STEPS + (
+        (ResourceAgentEvent.PAUSE, (), ResourceAgentState.STOPPED),
+    ),
+    # If active unknown, return to active unknown or command if possible.
+    ResourceAgentState.ACTIVE_UNKNOWN: _RESTORE_COMMAND_STEPS,
+}
+
+# If in a command reachable substate, attempt to return to command.
+_RESTORE_COMMAND_SUBSTATES = frozenset([
+    ResourceAgentState.TEST,
+    ResourceAgentState.CALIBRATE,
+    ResourceAgentState.DIRECT_ACCESS,
+    ResourceAgentState.BUSY,
+])
+for _state in _RESTORE_COMMAND_SUBSTATES:
+    _RESTORE_SCRIPTS[_state] = _RESTORE_COMMAND_STEPS
+del _state
+
 class DataSetAgent(InstrumentAgent):
     """
     this dataset agent has two states: autosampling and idle
@@ -79,6 +154,14 @@ class DataSetAgent(InstrumentAgent):
 
         self._retry_calculator = FactorialRetryCalculator(60, 1.5, 3600)
 
+        # Last driver memento handed to _set_state
+        self._persisted_driver_state = None
+
+        # Set to cut the current autoreconnect wait short.
+        self._reconnect_event = Event()
+        # Set to end the autoreconnect loop.
+        self._autoreconnect_stop = Event()
+
     ####
     ##    Response Handlers
     ####
@@ -129,9 +212,20 @@ class DataSetAgent(InstrumentAgent):
             origin=self.resource_id)
 
         # Setup reconnect timer.
-        self._autoreconnect_greenlet = gevent.spawn(self._autoreconnect)
-
-    def _autoreconnect(self):
+        # Each loop gets its own stop event so a loop that is still unwinding
+        # from a failed reconnect can't be revived by the next one.
+        self._reconnect_event.clear()
+        self._autoreconnect_stop = Event()
+        self._autoreconnect_greenlet = gevent.spawn(self._autoreconnect, self._autoreconnect_stop)
+
+    def _handler_lost_connection_exit(self, *args, **kwargs):
+        # Stop the reconnect loop, waking it if it is waiting.  This may be
+        # called from the loop itself so don't wait for it here.
+        self._autoreconnect_stop.set()
+        self._reconnect_event.set()
+        super(DataSetAgent, self)._handler_lost_connection_exit(*args, **kwargs)
+
+    def _autoreconnect(self, stop):
         """
         Retry logic.  Uses a factorial sequence to determine retry interval.
         Retry interval will cap out at 60 minutes.
@@ -140,13 +234,22 @@ class DataSetAgent(InstrumentAgent):
         than double the time we expect the error to have been cleared.
 
         The retry time will be the factorial se
+
+        Drivers configured with dvr_reconnect_callback can cut the wait
+        short by calling reconnect_callback, in which case the factorial
+        sequence only bounds how long we wait.  The loop ends once stop is
+        set.
         """
         log.debug("starting auto reconnect sequence.")
-        while self._autoreconnect_greenlet:
+        while not stop.is_set():
             sleep_time = self._retry_calculator.get_sleep_time()
 
             log.debug("Attempt reconnect in %d seconds", sleep_time)
-            gevent.sleep(sleep_time)
+            self._reconnect_event.wait(sleep_time)
+            self._reconnect_event.clear()
+            if stop.is_set():
+                break
+
             try:
                 self._fsm.on_event(ResourceAgentEvent.AUTORECONNECT)
             except:
@@ -174,16 +277,23 @@ class DataSetAgent(InstrumentAgent):
 
         return (next_state, None)
 
+    def _stop_autoreconnect(self, timeout=10):
+        """
+        End the autoreconnect loop, if running, and wait for it to finish.
+        """
+        self._autoreconnect_stop.set()
+        self._reconnect_event.set()
+
+        greenlet = self._autoreconnect_greenlet
+        if greenlet and greenlet is not gevent.getcurrent():
+            greenlet.join(timeout=timeout)
+        self._autoreconnect_greenlet = None
+
     ####
     ##    Helpers
     ####
     def _create_driver_plugin(self):
         try:
-            # Ensure the egg cache directory exists. ooi.reflections will fail
-            # somewhat silently when this directory doesn't exists.
-            if not os.path.isdir(EGG_CACHE_DIR):
-                os.makedirs(EGG_CACHE_DIR)
-
             log.debug("getting plugin config")
             uri = get_safe(self._dvr_config, 'dvr_egg')
             module_name = self._dvr_config['dvr_mod']
@@ -217,14 +327,33 @@ class DataSetAgent(InstrumentAgent):
                 else:
                     raise InstrumentStateException('agent.prior_state invalid: %s' % prior_state)
 
-        log.debug("Get driver object: %s, %s, %s, %s, %s", class_name, module_name, egg_name, egg_repo, memento)
         if uri:
-            egg_name = uri.split('/')[-1] if uri.startswith('http') else uri
-            egg_repo = uri[0:len(uri)-len(egg_name)-1] if uri.startswith('http') else None
+            if uri.startswith('http'):
+                egg_repo, egg_name = uri.rsplit('/', 1)
+            else:
+                egg_name = uri
 
-        log.debug("instantiate driver plugin %s.%s", module_name, class_name)
+        log.debug("Get driver object: %s, %s, %s, %s, %s", class_name, module_name, egg_name, egg_repo, memento)
         params = [config, memento, self.publish_callback, self.persist_state_callback, self.event_callback, self.exception_callback]
-        return EGG_CACHE.get_object(class_name, module_name, egg_name, egg_repo, params)
+
+        # Drivers that can tell when their data source is reachable again
+        # take an extra callback to cut the autoreconnect wait short.
+        if get_safe(self._dvr_config, 'dvr_reconnect_callback', False):
+            params.append(self.reconnect_callback)
+
+        # Only go through the egg cache the first time a driver class is
+        # needed, after that just construct a new instance.
+        key = (class_name, module_name, egg_name, egg_repo)
+        driver_class = _DRIVER_CLASSES.get(key)
+        if driver_class is not None:
+            log.debug("instantiate cached driver plugin %s.%s", module_name, class_name)
+            return driver_class(*params)
+
+        log.debug("instantiate driver plugin %s.%s", module_name, class_name)
+        driver = EGG_CACHE.get_object(class_name, module_name, egg_name, egg_repo, params)
+        if driver is not None:
+            _DRIVER_CLASSES[key] = type(driver)
+        return driver
 
 
     def _validate_driver_config(self):
@@ -235,18 +364,18 @@ class DataSetAgent(InstrumentAgent):
         log.debug("Driver Config: %s", self._dvr_config)
         out = True
 
-        for key in ('startup_config', 'dvr_mod', 'dvr_cls'):
-            if key not in self._dvr_config:
-                log.error('missing key: %s', key)
-                out = False
+        missing = _REQUIRED_DRIVER_CONFIG_KEYS.difference(self._dvr_config)
+        if missing:
+            log.error('missing keys: %s', sorted(missing))
+            out = False
 
-        for key in ('stream_config', ):
-            if key not in self.CFG:
-                log.error('missing key: %s', key)
-                out = False
+        if 'stream_config' not in self.CFG:
+            log.error('missing key: stream_config')
+            out = False
 
-        if get_safe(self._dvr_config, 'max_records', 100) < 1:
-            log.error('max_records=%d, must be at least 1 or unset (default 100)', self.max_records)
+        max_records = get_safe(self._dvr_config, 'max_records', 100)
+        if max_records < 1:
+            log.error('max_records=%d, must be at least 1 or unset (default 100)', max_records)
             out = False
 
         return out
@@ -280,6 +409,8 @@ class DataSetAgent(InstrumentAgent):
 
     def _stop_driver(self, force=True):
         log.warn("DRIVER: _stop_driver")
+        self._stop_autoreconnect()
+
         if self._dvr_client:
             self._dvr_client.stop_sampling()
 
@@ -290,43 +421,104 @@ class DataSetAgent(InstrumentAgent):
     ##    Callbacks
     ####
     def persist_state_callback(self, driver_state):
-        log.debug("Saving driver state: %r", driver_state)
+        # Skip a memento that is a different object equal to the last one
+        # saved, so the agent state isn't marked dirty and flushed again for
+        # nothing.  The same object is always saved since the driver may
+        # have updated it in place.
+        if driver_state is not self._persisted_driver_state and \
+           driver_state == self._persisted_driver_state:
+            return
+
+        # The memento can get large and this runs for every record, so only
+        # dump it when tracing.
+        log.trace("Saving driver state: %r", driver_state)
         self._set_state(DSA_STATE_KEY, driver_state)
+        self._persisted_driver_state = driver_state
 
     def publish_callback(self, particle):
         """
         Publish particles to the agent.
 
-        TODO: currently we are generating JSON serialized objects
-        we should be able to send with objects because we don't have
-        the zmq boundray issue in this client.
+        We don't have the zmq boundary issue in this client, so particles
+        that can build their dict directly skip the JSON encode/decode
+        round trip.  Older particles still hand us JSON strings.
+
+        Particles are published in batches.  A particle that fails to
+        generate ends the current batch: the records before it are
+        published, then the connection is reset and the rest of the
+        particles go out in a new batch.
 
         @return: number of records published
         """
         publish_count = 0
+        samples = []
+        for p in particle:
+            try:
+                samples.append(self._generate_sample(p))
+            except Exception as e:
+                publish_count += self._publish_samples(samples)
+                samples = []
+                self._sample_error(e)
+
+        publish_count += self._publish_samples(samples)
+        return publish_count
+
+    def _publish_samples(self, samples):
+        """
+        Publish a batch of generated samples.
+        @return: number of records published
+        """
+        log.debug("Particles received: %d", len(samples))
+        log.trace("Particles: %s", samples)
         try:
-            for p in particle:
-                # Can we use p.generate_dict() here?
-                p_obj = p.generate()
-                log.debug("Particle received: %s", p_obj)
-                self._async_driver_event_sample(p_obj, None)
-                publish_count += 1
+            self._async_driver_event_samples(samples, None)
         except Exception as e:
-            log.error("Error logging particle: %s", e, exc_info=True)
+            self._sample_error(e)
+            return 0
 
-            # Reset the connection id because we can not ensure contiguous
-            # data.
-            self._asp.reset_connection()
+        return len(samples)
 
-            log.debug("Publish ResourceAgentErrorEvent from publisher_callback")
-            self._event_publisher.publish_event(
-                error_msg = "Sample Parsing Exception: %s" % e,
-                event_type='ResourceAgentErrorEvent',
-                origin_type=self.ORIGIN_TYPE,
-                origin=self.resource_id
-            )
+    def _sample_error(self, e):
+        """
+        Report a particle that could not be generated or published.
+        """
+        log.error("Error logging particle: %s", e, exc_info=True)
 
-        return publish_count
+        # Reset the connection id because we can not ensure contiguous
+        # data.
+        self._asp.reset_connection()
+
+        log.debug("Publish ResourceAgentErrorEvent from publisher_callback")
+        self._event_publisher.publish_event(
+            error_msg = "Sample Parsing Exception: %s" % e,
+            event_type='ResourceAgentErrorEvent',
+            origin_type=self.ORIGIN_TYPE,
+            origin=self.resource_id
+        )
+
+    def _generate_sample(self, particle):
+        """
+        Return the sample dict for a particle.  Particles without
+        generate_dict hand us a JSON string from generate(), which is
+        decoded here so a bad record fails on its own.
+        """
+        generate_dict = getattr(particle, 'generate_dict', None)
+        if generate_dict is not None:
+            return generate_dict()
+
+        return json.loads(particle.generate())
+
+    def reconnect_callback(self):
+        """
+        Signal that the resource should be reachable again.  If the agent
+        has lost its connection, the reconnect is attempted right away
+        instead of waiting out the retry interval.
+
+        Passed to the driver as an extra constructor argument when the
+        driver config sets dvr_reconnect_callback.
+        """
+        log.debug("Reconnect requested")
+        self._reconnect_event.set()
 
     def exception_callback(self, exception):
         """
@@ -356,13 +548,10 @@ class DataSetAgent(InstrumentAgent):
         self._stop_pinger()
 
         self._aam.stop_all()
+        self._stop_autoreconnect()
 
-        params = {}
-        for (k,v) in self.aparam_pubrate.iteritems():
-            if v > 0:
-                params[k] = 0
-
-        if len(params)>0:
+        params = {k : 0 for (k,v) in self.aparam_pubrate.items() if v > 0}
+        if params:
             self.aparam_set_pubrate(params)
 
         state = self._fsm.get_current_state()
@@ -383,21 +572,38 @@ class DataSetAgent(InstrumentAgent):
         """
         Publish sample on sample data streams.
         """
-        # If the sample event is encoded, load it back to a dict.
-        if isinstance(val, str):
-            val = json.loads(val)
+        self._async_driver_event_samples([val], ts)
+
+    def _async_driver_event_samples(self, vals, ts):
+        """
+        Publish a list of samples on sample data streams.  Consecutive
+        samples are handed to the stream publisher as one batch; a particle
+        flagged with new_sequence starts a new batch after the connection
+        id has been reset.
+        """
+        if not vals:
+            return
 
-        new_sequence = val.get('new_sequence')
+        # If the sample events are encoded, load them back to dicts.
+        vals = [json.loads(val) if isinstance(val, str) else val for val in vals]
 
-        if new_sequence == True:
-            log.debug("New sequence flag detected in particle.  Resetting connection ID")
-            self._asp.reset_connection()
+        # Most batches have no new sequence flag and go out in one piece.
+        starts = [i for (i, val) in enumerate(vals) if val.get('new_sequence') == True]
+        if not starts:
+            self._asp.on_sample_mult(vals)
+        else:
+            if starts[0] > 0:
+                self._asp.on_sample_mult(vals[:starts[0]])
+            for (start, end) in zip(starts, starts[1:] + [len(vals)]):
+                log.debug("New sequence flag detected in particle.  Resetting connection ID")
+                self._asp.reset_connection()
+                self._asp.on_sample_mult(vals[start:end])
 
-        super(DataSetAgent, self)._async_driver_event_sample(val, ts)
+        for val in vals:
+            self._process_sample_alerts(val)
 
     def _filter_capabilities(self, events):
-        events_out = [x for x in events if DataSetAgentCapability.has(x)]
-        return events_out
+        return list(filter(_CAPABILITY_VALUES.__contains__, events))
 
     def _restore_resource(self, state, prev_state):
         """
@@ -414,114 +620,48 @@ class DataSetAgent(InstrumentAgent):
         if state == ResourceAgentState.LOST_CONNECTION:
             state = prev_state
 
-        try:
-            cur_state = self._fsm.get_current_state()
-
-            # If unitialized, confirm and do nothing.
-            if state == ResourceAgentState.UNINITIALIZED:
-                if cur_state != state:
-                    raise Exception()
-
-            # If inactive, initialize and confirm.
-            elif state == ResourceAgentState.INACTIVE:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != state:
-                    raise Exception()
-
-            # If idle, initialize, activate and confirm.
-            elif state == ResourceAgentState.IDLE:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                self._fsm.on_event(ResourceAgentEvent.GO_ACTIVE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != state:
-                    raise Exception()
-
-            # If streaming, initialize, activate and confirm.
-            # Driver discover should put us in streaming mode.
-            elif state == ResourceAgentState.STREAMING:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                self._fsm.on_event(ResourceAgentEvent.GO_ACTIVE)
-                self._fsm.on_event(ResourceAgentEvent.RUN)
-                self._fsm.on_event(ResourceAgentEvent.EXECUTE_RESOURCE, DriverEvent.START_AUTOSAMPLE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != state:
-                    raise Exception()
-
-            # If command, initialize, activate, confirm idle,
-            # run and confirm command.
-            elif state == ResourceAgentState.COMMAND:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                self._fsm.on_event(ResourceAgentEvent.GO_ACTIVE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != ResourceAgentState.IDLE:
-                    raise Exception()
-                self._fsm.on_event(ResourceAgentEvent.RUN)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != state:
-                    raise Exception()
-
-            # If paused, initialize, activate, confirm idle,
-            # run, confirm command, pause and confirm stopped.
-            elif state == ResourceAgentState.STOPPED:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                self._fsm.on_event(ResourceAgentEvent.GO_ACTIVE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != ResourceAgentState.IDLE:
-                    raise Exception()
-                self._fsm.on_event(ResourceAgentEvent.RUN)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != ResourceAgentState.COMMAND:
-                    raise Exception()
-                self._fsm.on_event(ResourceAgentEvent.PAUSE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != state:
-                    raise Exception()
-
-            # If in a command reachable substate, attempt to return to command.
-            # Initialize, activate, confirm idle, run confirm command.
-            elif state in [ResourceAgentState.TEST,
-                    ResourceAgentState.CALIBRATE,
-                    ResourceAgentState.DIRECT_ACCESS,
-                    ResourceAgentState.BUSY]:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                self._fsm.on_event(ResourceAgentEvent.GO_ACTIVE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != ResourceAgentState.IDLE:
-                    raise Exception()
-                self._fsm.on_event(ResourceAgentEvent.RUN)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != ResourceAgentState.COMMAND:
-                    raise Exception()
-
-            # If active unknown, return to active unknown or command if
-            # possible. Initialize, activate, confirm active unknown, else
-            # confirm idle, run, confirm command.
-            elif state == ResourceAgentState.ACTIVE_UNKNOWN:
-                self._fsm.on_event(ResourceAgentEvent.INITIALIZE)
-                self._fsm.on_event(ResourceAgentEvent.GO_ACTIVE)
-                cur_state = self._fsm.get_current_state()
-                if cur_state == ResourceAgentState.ACTIVE_UNKNOWN:
-                    return
-                elif cur_state != ResourceAgentState.IDLE:
-                    raise Exception()
-                self._fsm.on_event(ResourceAgentEvent.RUN)
-                cur_state = self._fsm.get_current_state()
-                if cur_state != ResourceAgentState.COMMAND:
-                    raise Exception()
+        on_event = self._fsm.on_event
+        get_current_state = self._fsm.get_current_state
+        cur_state = get_current_state()
 
-            else:
-                log.error('Instrument agent %s error restoring unhandled state %s, current state %s.',
+        # If unitialized, confirm and do nothing.
+        if state == ResourceAgentState.UNINITIALIZED:
+            if cur_state != state:
+                log.error('Instrument agent %s error restoring state %s, current state %s.',
                         self.id, state, cur_state)
+                return
+
+        elif state in _RESTORE_SCRIPTS:
+            for (event, event_args, expected_state) in _RESTORE_SCRIPTS[state]:
+                try:
+                    on_event(event, *event_args)
+                except Exception as ex:
+                    log.error('Instrument agent %s error restoring state %s, current state %s, exception %s.',
+                            self.id, state, get_current_state(), str(ex))
+                    log.exception('###### Agent restore stack trace:')
+                    return
 
-        except Exception as ex:
-            log.error('Instrument agent %s error restoring state %s, current state %s, exception %s.',
-                    self.id, state, cur_state, str(ex))
-            log.exception('###### Agent restore stack trace:')
+                if expected_state is None:
+                    continue
+
+                cur_state = get_current_state()
+                # Active unknown may come up on activation instead of idle,
+                # in which case we are done.
+                if state == cur_state == ResourceAgentState.ACTIVE_UNKNOWN and \
+                   event == ResourceAgentEvent.GO_ACTIVE:
+                    break
+                if cur_state != expected_state:
+                    log.error('Instrument agent %s error restoring state %s, current state %s, expected %s.',
+                            self.id, state, cur_state, expected_state)
+                    return
 
         else:
-            log.debug('Instrument agent %s restored state %s = %s.',
-                     self.id, state, cur_state)
+            log.error('Instrument agent %s error restoring unhandled state %s, current state %s.',
+                    self.id, state, cur_state)
+            return
+
+        log.debug('Instrument agent %s restored state %s = %s.',
+                 self.id, state, cur_state)
 
 
 class FactorialRetryCalculator(object):
@@ -535,18 +675,27 @@ class FactorialRetryCalculator(object):
         @param maximum_retry_time max seconds to allow for a retry
         """
         if not retry_coefficient > 0:
-            ValueError("retry coefficient must be > 0")
+            raise ValueError("retry coefficient must be > 0")
 
         if not retry_tolerance_coefficient > 1:
-            ValueError("retry coefficient must be > 1")
+            raise ValueError("retry tolerance coefficient must be > 1")
 
         if not maximum_retry_time > 0:
-            ValueError("retry coefficient must be > 0")
+            raise ValueError("maximum retry time must be > 0")
 
         self._retry_coeff = retry_coefficient
         self._tolerance_coeff = retry_tolerance_coefficient
         self._max_retry_time = maximum_retry_time
-        self._max_retry_index = None
+
+        # Find the first retry index whose factorial timeout reaches the max
+        # retry time.  From that index on we just return the max.
+        index = 0
+        factor = 1
+        while retry_coefficient * factor < maximum_retry_time:
+            index += 1
+            factor *= index
+        self._max_retry_index = index
+
         self.reset_retry_counter()
 
     def reset_retry_counter(self):
@@ -555,6 +704,7 @@ class FactorialRetryCalculator(object):
         """
         self._last_retry = None
         self._retry_count = 0
+        self._current_factor = 1
 
     def get_sleep_time(self):
         """
@@ -564,35 +714,30 @@ class FactorialRetryCalculator(object):
         self._clear_retry_state()
 
         self._last_retry = time.time()
+        retry_index = self._retry_count
         self._retry_count += 1
 
-        return self._calc_sleep_time(self._retry_count - 1)
+        if retry_index >= self._max_retry_index:
+            return self._max_retry_time
+
+        # Keep a running factorial so we only need one multiply per retry.
+        self._current_factor *= max(retry_index, 1)
+        return self._retry_coeff * self._current_factor
 
     def _clear_retry_state(self):
         """
         If we need to clear the retry state, do it!
         """
-        retry = self._retry_count - 1
-        if retry < 0: retry = 0
-
-        time_delta = self._calc_sleep_time(retry) * self._tolerance_coeff
+        time_delta = self._calc_sleep_time() * self._tolerance_coeff
         if self._last_retry is None or  time.time() - self._last_retry > time_delta:
             self.reset_retry_counter()
 
-    def _calc_sleep_time(self, retry_index):
+    def _calc_sleep_time(self):
         """
-        Calculate the sleep time for a retry index
+        Calculate the sleep time for the last retry index
         """
-        # If we have already passed the retry index that would return the max timeout
-        # then there is no reason to calculate the timeout.
-        if self._max_retry_index is not None and self._max_retry_index <= self._retry_count:
+        retry_index = max(self._retry_count - 1, 0)
+        if retry_index >= self._max_retry_index:
             return self._max_retry_time
 
-        # Calculate the timeout
-        else:
-            timeout = self._retry_coeff * math.factorial(retry_index)
-            if timeout >= self._max_retry_time:
-                self._max_retry_index = retry_index + 1
-                return self._max_retry_time
-            else:
-                return timeout
+        return self._retry_coeff * self._current_factor
@@ -601,10 +601,17 @@ class DatasetAgentTestCase(IonIntegrationTestCase):
                 pubsub_client.delete_subscription(subscriber.subscription_id)
             subscriber.stop()
 
+    def _granule_record_count(self, granule):
+        """
+        Return the number of records in a granule.  The agent publishes
+        the particles from a driver callback as one granule.
+        """
+        return len(RecordDictionaryTool.load_from_granule(granule))
+
     def get_samples(self, stream_name, sample_count=1, timeout=30):
         """
-        listen on a stream until 'sample_count' samples are read and return
-        a list of all samples read.  If the required number of samples aren't
+        listen on a stream until 'sample_count' records are read and return
+        a list of all granules read.  If the required number of records aren't
         read then throw an exception.
 
         Note that this method does not clear the sample queue for the stream.
@@ -629,9 +636,10 @@ class DatasetAgentTestCase(IonIntegrationTestCase):
             while(not done):
                 if (self._samples_received.has_key(stream_id) and
                    len(self._samples_received.get(stream_id))):
-                    log.trace("get_samples() received sample #%d!", i)
-                    result.append(self._samples_received[stream_id].pop(0))
-                    i += 1
+                    granule = self._samples_received[stream_id].pop(0)
+                    result.append(granule)
+                    i += self._granule_record_count(granule)
+                    log.trace("get_samples() received %d record(s)", i)
 
                     if i >= sample_count:
                         done = True
@@ -758,7 +766,7 @@ class DatasetAgentTestCase(IonIntegrationTestCase):
 
     def assert_sample_queue_size(self, stream_name, size):
         """
-        verify a sample queue is the size we expect it to be.
+        verify a sample queue holds the number of records we expect.
         """
         # Sleep a couple seconds to ensure the
         gevent.sleep(2)
@@ -766,7 +774,7 @@ class DatasetAgentTestCase(IonIntegrationTestCase):
         stream_id = self._stream_id_map.get(stream_name)
         length = 0
         if stream_id in self._samples_received:
-            length = len(self._samples_received[stream_id])
+            length = sum(self._granule_record_count(g) for g in self._samples_received[stream_id])
         self.assertEqual(length, size, msg="Queue size != expected size (%d != %d)" % (length, size))
 
     def assert_set_pubrate(self, rate):
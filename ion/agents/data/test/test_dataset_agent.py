@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+
+"""
+@package ion.agents.data.test.test_dataset_agent
+@file ion/agents/data/test/test_dataset_agent.py
+@brief Unit tests for the dataset agent helpers
+"""
+
+__license__ = 'Apache 2.0'
+
+import json
+
+from mock import Mock, call, patch
+from nose.plugins.attrib import attr
+from pyon.util.unit_test import IonUnitTestCase
+
+from pyon.agent.agent import ResourceAgentEvent
+from pyon.agent.agent import ResourceAgentState
+
+from ion.core.includes.mi import DriverEvent
+from ion.agents.data import dataset_agent
+from ion.agents.data.dataset_agent import DataSetAgent
+
+
+@attr('UNIT', group='sa')
+class TestDataSetAgentPublish(IonUnitTestCase):
+
+    def setUp(self):
+        # Skip the process setup, we only need the publishing helpers.
+        self.agent = DataSetAgent.__new__(DataSetAgent)
+        self.agent._asp = Mock()
+        self.agent._aam = Mock()
+        self.agent._event_publisher = Mock()
+        self.agent._proc_name = 'dsa'
+        self.agent.resource_id = '123'
+
+    def _sample(self, value, new_sequence=None):
+        sample = {'stream_name': 'parsed',
+                  'values': [{'value_id': 'temp', 'value': value}]}
+        if new_sequence is not None:
+            sample['new_sequence'] = new_sequence
+        return sample
+
+    def _particle(self, sample):
+        particle = Mock(spec=['generate_dict'])
+        particle.generate_dict.return_value = sample
+        return particle
+
+    def test_samples_single_batch(self):
+        samples = [self._sample(1), self._sample(2), self._sample(3)]
+
+        self.agent._async_driver_event_samples(samples, None)
+
+        self.assertEqual(self.agent._asp.mock_calls, [call.on_sample_mult(samples)])
+        self.assertEqual(self.agent._aam.process_alerts.call_count, 3)
+
+    def test_samples_decode_json(self):
+        sample = self._sample(1)
+
+        self.agent._async_driver_event_samples([json.dumps(sample)], None)
+
+        self.assertEqual(self.agent._asp.mock_calls, [call.on_sample_mult([sample])])
+
+    def test_samples_split_on_new_sequence(self):
+        a = self._sample(1)
+        b = self._sample(2, new_sequence=True)
+        c = self._sample(3)
+        d = self._sample(4, new_sequence=True)
+
+        self.agent._async_driver_event_samples([a, b, c, d], None)
+
+        self.assertEqual(self.agent._asp.mock_calls, [
+            call.on_sample_mult([a]),
+            call.reset_connection(),
+            call.on_sample_mult([b, c]),
+            call.reset_connection(),
+            call.on_sample_mult([d]),
+        ])
+
+    def test_samples_empty(self):
+        self.agent._async_driver_event_samples([], None)
+
+        self.assertEqual(self.agent._asp.mock_calls, [])
+
+    def test_publish_callback(self):
+        samples = [self._sample(1), self._sample(2)]
+
+        count = self.agent.publish_callback([self._particle(s) for s in samples])
+
+        self.assertEqual(count, 2)
+        self.assertEqual(self.agent._asp.mock_calls, [call.on_sample_mult(samples)])
+        self.assertFalse(self.agent._event_publisher.publish_event.called)
+
+    def test_publish_callback_legacy_particle(self):
+        sample = self._sample(1)
+        particle = Mock(spec=['generate'])
+        particle.generate.return_value = json.dumps(sample)
+
+        count = self.agent.publish_callback([particle])
+
+        self.assertEqual(count, 1)
+        self.assertEqual(self.agent._asp.mock_calls, [call.on_sample_mult([sample])])
+
+    def test_publish_callback_partial_failure(self):
+        a = self._sample(1)
+        c = self._sample(3)
+        bad = Mock(spec=['generate_dict'])
+        bad.generate_dict.side_effect = Exception('bad particle')
+
+        count = self.agent.publish_callback([self._particle(a), bad, self._particle(c)])
+
+        # Records on both sides of the failure are published, with the
+        # connection reset in between.
+        self.assertEqual(count, 2)
+        self.assertEqual(self.agent._asp.mock_calls, [
+            call.on_sample_mult([a]),
+            call.reset_connection(),
+            call.on_sample_mult([c]),
+        ])
+        self.assertEqual(self.agent._event_publisher.publish_event.call_count, 1)
+        kwargs = self.agent._event_publisher.publish_event.call_args[1]
+        self.assertEqual(kwargs['event_type'], 'ResourceAgentErrorEvent')
+
+    def test_publish_callback_publish_failure(self):
+        self.agent._asp.on_sample_mult.side_effect = Exception('publish failed')
+
+        count = self.agent.publish_callback([self._particle(self._sample(1))])
+
+        self.assertEqual(count, 0)
+        self.agent._asp.reset_connection.assert_called_once_with()
+        self.assertEqual(self.agent._event_publisher.publish_event.call_count, 1)
+
+
+@attr('UNIT', group='sa')
+class TestDataSetAgentDriverPlugin(IonUnitTestCase):
+
+    def setUp(self):
+        self.agent = DataSetAgent.__new__(DataSetAgent)
+        self.agent.resource_id = '123'
+        self.agent._get_state = Mock(return_value={'position': 1})
+        self.agent._dvr_config = {'dvr_mod': 'mi.dataset.driver',
+                                  'dvr_cls': 'Driver',
+                                  'startup_config': {}}
+
+        # Always go through the egg cache.
+        patcher = patch.dict(dataset_agent._DRIVER_CLASSES, clear=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        patcher = patch.object(dataset_agent, 'EGG_CACHE')
+        self.egg_cache = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.egg_cache.get_object.return_value = Mock()
+
+    def _driver_params(self):
+        self.agent._create_driver_plugin()
+        return self.egg_cache.get_object.call_args[0][4]
+
+    def test_default_params(self):
+        params = self._driver_params()
+
+        self.assertEqual(len(params), 6)
+        self.assertNotIn(self.agent.reconnect_callback, params)
+
+    def test_reconnect_callback_param(self):
+        self.agent._dvr_config['dvr_reconnect_callback'] = True
+
+        params = self._driver_params()
+
+        self.assertEqual(len(params), 7)
+        self.assertEqual(params[-1], self.agent.reconnect_callback)
+
+    def test_reconnect_callback_wakes_reconnect(self):
+        self.agent._reconnect_event = Mock()
+
+        self.agent.reconnect_callback()
+
+        self.agent._reconnect_event.set.assert_called_once_with()
+
+
+@attr('UNIT', group='sa')
+class TestDataSetAgentPersistState(IonUnitTestCase):
+
+    def setUp(self):
+        self.agent = DataSetAgent.__new__(DataSetAgent)
+        self.agent._persisted_driver_state = None
+        self.agent._set_state = Mock()
+
+    def test_persist_changed_state(self):
+        self.agent.persist_state_callback({'position': 1})
+        self.agent.persist_state_callback({'position': 2})
+
+        self.assertEqual(self.agent._set_state.call_count, 2)
+
+    def test_persist_same_object(self):
+        memento = {'position': 1}
+        self.agent.persist_state_callback(memento)
+        memento['position'] = 2
+        self.agent.persist_state_callback(memento)
+
+        self.assertEqual(self.agent._set_state.call_count, 2)
+
+    def test_skip_equal_state(self):
+        self.agent.persist_state_callback({'position': 1})
+        self.agent.persist_state_callback({'position': 1})
+
+        self.agent._set_state.assert_called_once_with(dataset_agent.DSA_STATE_KEY, {'position': 1})
+
+
+class FakeFSM(object):
+    """
+    Minimal FSM stand in: each event moves to a fixed state.
+    """
+    TRANSITIONS = {
+        ResourceAgentEvent.INITIALIZE: ResourceAgentState.INACTIVE,
+        ResourceAgentEvent.GO_ACTIVE: ResourceAgentState.IDLE,
+        ResourceAgentEvent.RUN: ResourceAgentState.COMMAND,
+        ResourceAgentEvent.PAUSE: ResourceAgentState.STOPPED,
+        ResourceAgentEvent.EXECUTE_RESOURCE: ResourceAgentState.STREAMING,
+    }
+
+    def __init__(self, transitions=None, fail_on=None):
+        self.state = ResourceAgentState.UNINITIALIZED
+        self.transitions = dict(self.TRANSITIONS)
+        self.transitions.update(transitions or {})
+        self.fail_on = fail_on
+        self.events = []
+
+    def get_current_state(self):
+        return self.state
+
+    def on_event(self, event, *args):
+        self.events.append((event,) + args)
+        if event == self.fail_on:
+            raise Exception('%s failed' % event)
+        self.state = self.transitions[event]
+
+
+@attr('UNIT', group='sa')
+class TestDataSetAgentRestore(IonUnitTestCase):
+
+    def setUp(self):
+        self.agent = DataSetAgent.__new__(DataSetAgent)
+        self.agent.id = 'dsa'
+
+        patcher = patch.object(dataset_agent, 'log')
+        self.log = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _restore(self, state, prev_state=None, **kwargs):
+        self.agent._fsm = FakeFSM(**kwargs)
+        self.agent._restore_resource(state, prev_state)
+        return self.agent._fsm
+
+    def _restored(self):
+        return any('restored' in c[0][0] for c in self.log.debug.call_args_list)
+
+    def test_restore_scripts(self):
+        command_substates = dataset_agent._RESTORE_COMMAND_SUBSTATES
+        for (state, script) in dataset_agent._RESTORE_SCRIPTS.items():
+            self.log.reset_mock()
+            fsm = self._restore(state)
+
+            expected_events = [(event,) + event_args for (event, event_args, _) in script]
+            self.assertEqual(fsm.events, expected_events, msg=state)
+            if state in command_substates or state == ResourceAgentState.ACTIVE_UNKNOWN:
+                self.assertEqual(fsm.state, ResourceAgentState.COMMAND, msg=state)
+            else:
+                self.assertEqual(fsm.state, state, msg=state)
+            self.assertTrue(self._restored(), msg=state)
+            self.assertFalse(self.log.error.called, msg=state)
+
+    def test_restore_streaming_events(self):
+        fsm = self._restore(ResourceAgentState.STREAMING)
+
+        self.assertEqual(fsm.events[-1], (ResourceAgentEvent.EXECUTE_RESOURCE, DriverEvent.START_AUTOSAMPLE))
+
+    def test_restore_uninitialized(self):
+        fsm = self._restore(ResourceAgentState.UNINITIALIZED)
+
+        self.assertEqual(fsm.events, [])
+        self.assertTrue(self._restored())
+
+    def test_restore_no_state(self):
+        fsm = self._restore(None)
+
+        self.assertEqual(fsm.events, [])
+        self.assertFalse(self._restored())
+
+    def test_restore_active_unknown(self):
+        fsm = self._restore(ResourceAgentState.ACTIVE_UNKNOWN,
+                            transitions={ResourceAgentEvent.GO_ACTIVE: ResourceAgentState.ACTIVE_UNKNOWN})
+
+        self.assertEqual(fsm.events, [(ResourceAgentEvent.INITIALIZE,), (ResourceAgentEvent.GO_ACTIVE,)])
+        self.assertTrue(self._restored())
+        self.assertFalse(self.log.error.called)
+
+    def test_restore_checkpoint_mismatch(self):
+        fsm = self._restore(ResourceAgentState.COMMAND,
+                            transitions={ResourceAgentEvent.GO_ACTIVE: ResourceAgentState.ACTIVE_UNKNOWN})
+
+        self.assertEqual(fsm.events, [(ResourceAgentEvent.INITIALIZE,), (ResourceAgentEvent.GO_ACTIVE,)])
+        self.assertTrue(self.log.error.called)
+        self.assertFalse(self._restored())
+
+    def test_restore_no_early_stop(self):
+        # Only active unknown may be reached early.
+        fsm = self._restore(ResourceAgentState.STOPPED,
+                            transitions={ResourceAgentEvent.GO_ACTIVE: ResourceAgentState.STOPPED})
+
+        self.assertEqual(fsm.events, [(ResourceAgentEvent.INITIALIZE,), (ResourceAgentEvent.GO_ACTIVE,)])
+        self.assertTrue(self.log.error.called)
+        self.assertFalse(self._restored())
+
+    def test_restore_event_exception(self):
+        fsm = self._restore(ResourceAgentState.STREAMING, fail_on=ResourceAgentEvent.RUN)
+
+        self.assertEqual(fsm.events, [(ResourceAgentEvent.INITIALIZE,),
+                                      (ResourceAgentEvent.GO_ACTIVE,),
+                                      (ResourceAgentEvent.RUN,)])
+        self.assertTrue(self.log.error.called)
+        self.assertTrue(self.log.exception.called)
+        self.assertFalse(self._restored())
+
+    def test_restore_unhandled_state(self):
+        fsm = self._restore('BOGUS_STATE')
+
+        self.assertEqual(fsm.events, [])
+        self.assertTrue(self.log.error.called)
+        self.assertFalse(self._restored())
+
+    def test_restore_lost_connection(self):
+        fsm = self._restore(ResourceAgentState.LOST_CONNECTION, ResourceAgentState.IDLE)
+
+        self.assertEqual(fsm.events, [(ResourceAgentEvent.INITIALIZE,), (ResourceAgentEvent.GO_ACTIVE,)])
+        self.assertEqual(fsm.state, ResourceAgentState.IDLE)
+        self.assertTrue(self._restored())
+
+
+@attr('UNIT', group='sa')
+class TestFactorialRetryCalculator(IonUnitTestCase):
+
+    def setUp(self):
+        patcher = patch.object(dataset_agent, 'time')
+        self.time = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.time.time.return_value = 1000.0
+
+    def _sleep_times(self, calculator, count):
+        return [calculator.get_sleep_time() for _ in xrange(count)]
+
+    def test_sequence(self):
+        calculator = dataset_agent.FactorialRetryCalculator(60, 1.5, 3600)
+
+        self.assertEqual(self._sleep_times(calculator, 8), [60, 60, 120, 360, 1440, 3600, 3600, 3600])
+
+    def test_coefficient_at_max(self):
+        for coefficient in (3600, 5000):
+            calculator = dataset_agent.FactorialRetryCalculator(coefficient, 1.5, 3600)
+
+            self.assertEqual(self._sleep_times(calculator, 3), [3600, 3600, 3600])
+
+    def test_reset_retry_counter(self):
+        calculator = dataset_agent.FactorialRetryCalculator(60, 1.5, 3600)
+        self._sleep_times(calculator, 4)
+
+        calculator.reset_retry_counter()
+
+        self.assertEqual(self._sleep_times(calculator, 3), [60, 60, 120])
+
+    def test_reset_after_tolerance(self):
+        calculator = dataset_agent.FactorialRetryCalculator(60, 1.5, 3600)
+        self._sleep_times(calculator, 3)
+
+        # The last sleep was 120 seconds, so retries within 180 seconds continue the sequence.
+        self.time.time.return_value += 179
+        self.assertEqual(calculator.get_sleep_time(), 360)
+
+        # The last sleep was 360 seconds, so anything past 540 seconds starts over.
+        self.time.time.return_value += 541
+        self.assertEqual(self._sleep_times(calculator, 2), [60, 60])
+
+    def test_invalid_config(self):
+        self.assertRaises(ValueError, dataset_agent.FactorialRetryCalculator, 0, 1.5, 3600)
+        self.assertRaises(ValueError, dataset_agent.FactorialRetryCalculator, 60, 1, 3600)
+        self.assertRaises(ValueError, dataset_agent.FactorialRetryCalculator, 60, 1.5, 0)
@@ -1214,6 +1214,12 @@ class InstrumentAgent(ResourceAgent):
             val = json.loads(val)
 
         self._asp.on_sample(val)
+        self._process_sample_alerts(val)
+
+    def _process_sample_alerts(self, val):
+        """
+        Run the alert manager over the values of a decoded sample.
+        """
         try:
             stream_name = val['stream_name']
             values = val['values']
@@ -256,9 +256,11 @@ class PolicyManagementService(BasePolicyManagementService):
         if not policy:
             raise NotFound("Policy %s does not exist" % policy_id)
 
-        res_list = self._find_resources_for_policy(policy_id)
-        for res in res_list:
-            self._remove_resource_policy(res, policy)
+        #The associations come back with the resources, so there is no need to look each one up again
+        res_list, assoc_list = self.clients.resource_registry.find_subjects(None, PRED.hasPolicy, policy_id)
+        for res, assoc in zip(res_list, assoc_list):
+            self.clients.resource_registry.delete_association(assoc)
+            self._publish_resource_policy_event(policy, res)
 
         self.clients.resource_registry.delete(policy_id)
 
@@ -501,10 +503,14 @@ class PolicyManagementService(BasePolicyManagementService):
 
         log.debug("Retrieving policies for resources: %s", resource_id_list)
 
-        for res_id in resource_id_list:
-            policy_set = self._find_resource_policies(res_id)
+        #Fetch the policies for all of the resources in one call, then keep them in resource order
+        policy_list, assoc_list = self.clients.resource_registry.find_objects_mult(subjects=resource_id_list, id_only=False, predicate=PRED.hasPolicy)
+        resource_policies = dict()
+        for p, assoc in zip(policy_list, assoc_list):
+            resource_policies.setdefault(assoc.s, []).append(p)
 
-            for p in policy_set:
+        for res_id in resource_id_list:
+            for p in resource_policies.get(res_id, []):
                 if p.enabled and p.policy_type.type_ == OT.ResourceAccessPolicy :
                     log.debug("Including policy: %s", p.name)
                     rules += p.policy_type.policy_rule
@@ -700,12 +706,13 @@ class PolicyManagementService(BasePolicyManagementService):
         if not user_role_id:
             raise BadRequest("The user_role_id parameter is missing")
 
-        user_role = self.clients.resource_registry.read(user_role_id)
-        if not user_role:
-            raise NotFound("Role %s does not exist" % user_role_id)
-
-        alist,_ = self.clients.resource_registry.find_subjects(RT.ActorIdentity, PRED.hasRole, user_role)
+        alist,_ = self.clients.resource_registry.find_subjects(RT.ActorIdentity, PRED.hasRole, user_role_id, id_only=True)
         if len(alist) > 0:
+            #Only need the role object for its name in the error
+            user_role = self.read_role(user_role_id)
             raise BadRequest('The User Role %s cannot be removed as there are %s users associated to it' % (user_role.name, str(len(alist))))
 
-        self.clients.resource_registry.delete(user_role_id)
+        try:
+            self.clients.resource_registry.delete(user_role_id)
+        except NotFound:
+            raise NotFound("Role %s does not exist" % user_role_id)
@@ -33,6 +33,7 @@ class TestPolicyManagementService(PyonTestCase):
         self.mock_find_objects = mock_clients.resource_registry.find_objects
         self.mock_find_resources = mock_clients.resource_registry.find_resources
         self.mock_find_subjects = mock_clients.resource_registry.find_subjects
+        self.mock_find_objects_mult = mock_clients.resource_registry.find_objects_mult
 
         # Policy
         self.policy = Mock()
@@ -90,6 +91,7 @@ class TestPolicyManagementService(PyonTestCase):
 
         self.policy_management_service.delete_policy('111')
 
+        self.mock_delete_association.assert_called_once_with(self.policy_to_resource_association)
         self.mock_delete.assert_called_once_with('111')
 
     def test_read_policy_not_found(self):
@@ -114,6 +116,31 @@ class TestPolicyManagementService(PyonTestCase):
         self.assertEqual(ex.message, 'Policy bad does not exist')
         self.mock_read.assert_called_once_with('bad', '')
 
+    def test_get_active_resource_access_policy_rules(self):
+        self.mock_read.return_value = self.resource
+
+        policy1 = Mock()
+        policy1.enabled = True
+        policy1.policy_type.type_ = OT.ResourceAccessPolicy
+        policy1.policy_type.policy_rule = '<Rule id="1"/>'
+        policy2 = Mock()
+        policy2.enabled = True
+        policy2.policy_type.type_ = OT.ResourceAccessPolicy
+        policy2.policy_type.policy_rule = '<Rule id="2"/>'
+        policy3 = Mock()
+        policy3.enabled = False
+
+        assoc1 = Mock(s='456')
+        assoc2 = Mock(s='123')
+        assoc3 = Mock(s='123')
+        self.mock_find_objects_mult.return_value = ([policy1, policy2, policy3], [assoc1, assoc2, assoc3])
+
+        with patch.object(self.policy_management_service, '_get_related_resource_ids', return_value=['123', '456']):
+            rules = self.policy_management_service.get_active_resource_access_policy_rules('123')
+
+        self.assertEqual(rules, '<Rule id="2"/><Rule id="1"/>')
+        self.mock_find_objects_mult.assert_called_once_with(subjects=['123', '456'], id_only=False, predicate=PRED.hasPolicy)
+
 
     def test_create_user_role(self):
         self.mock_create.return_value = ['123', 1]
@@ -140,12 +167,25 @@ class TestPolicyManagementService(PyonTestCase):
         self.mock_update.assert_called_once_with(user_role)
 
     def test_delete_user_role(self):
-        self.mock_read.return_value = self.user_role
         self.mock_find_subjects.return_value = ([], [])
 
         self.policy_management_service.delete_role('123')
 
+        self.mock_find_subjects.assert_called_once_with(RT.ActorIdentity, PRED.hasRole, '123', id_only=True)
         self.mock_delete.assert_called_once_with('123')
+        self.assertFalse(self.mock_read.called)
+
+    def test_delete_user_role_in_use(self):
+        self.mock_read.return_value = self.user_role
+        self.mock_find_subjects.return_value = (['456'], [Mock()])
+
+        with self.assertRaises(BadRequest) as cm:
+            self.policy_management_service.delete_role('123')
+
+        ex = cm.exception
+        self.assertEqual(ex.message, 'The User Role COI Test Administrator cannot be removed as there are 1 users associated to it')
+        self.mock_read.assert_called_once_with('123', '')
+        self.assertFalse(self.mock_delete.called)
 
     def test_read_user_role_not_found(self):
         self.mock_read.return_value = None
@@ -159,7 +199,8 @@ class TestPolicyManagementService(PyonTestCase):
         self.mock_read.assert_called_once_with('bad role', '')
 
     def test_delete_user_role_not_found(self):
-        self.mock_read.return_value = None
+        self.mock_find_subjects.return_value = ([], [])
+        self.mock_delete.side_effect = NotFound('Object with id bad role does not exist.')
 
         # TEST: Execute the service operation call
         with self.assertRaises(NotFound) as cm:
@@ -167,7 +208,8 @@ class TestPolicyManagementService(PyonTestCase):
 
         ex = cm.exception
         self.assertEqual(ex.message, 'Role bad role does not exist')
-        self.mock_read.assert_called_once_with('bad role', '')
+        self.mock_delete.assert_called_once_with('bad role')
+        self.assertFalse(self.mock_read.called)
 
 
 @attr('INT', group='coi')